@@ -2,14 +2,17 @@
 Python 3.4 FTP Pusher script
 '''
 
+import importlib
+import itertools
 import os
 import logging
 import sys
+import time
 
-import ftputil
-from ftputil.error import FTPError
-import keyring
-import pysftp
+# NOTE: ftputil, keyring and pysftp are imported on first
+# use via getModule() so that a plain-FTP run never pays
+# for loading pysftp (and with it paramiko and cryptography);
+# likewise the modules only the spool and delta options use
 
 # =============================
 # Define module-level variables
@@ -28,6 +31,22 @@ useSSH = False
 srcPathName = None
 srcFileNames = ['test1.txt']
 
+# if specified, files are hard-linked
+# (or reflink-copied) into this folder
+# and uploaded from there, not from srcPathName
+spoolPathName = None
+
+# file systems (by st_dev) on which
+# a reflink has already failed
+reflinkUnsupportedDevs = set()
+
+# if True, SFTP uploads only send the blocks
+# of a file that have changed since its last push,
+# as recorded in the block signatures cached here
+useDeltaTransfer = False
+deltaSigPathName = '~/.PyFtpPusher/signatures'
+deltaBlockSize = 1024 * 1024
+
 # instantiate and initialize
 # logging objects and handlers
 dftMsgFormat = '%(asctime)s\t%(levelname)s\t%(module)s\t%(funcName)s\t%(lineno)d\t%(message)s'
@@ -35,41 +54,14 @@ dftDateFormat = '%Y-%m-%d %H:%M:%S'
 
 nmlLogLevel = logging.DEBUG
 
-# obtain any command-line arguments
-# overriding any values set so far
-nextArg = ''
-for argv in sys.argv:
-    if nextArg != '':
-        if nextArg == 'ftpUrl':
-            ftpUrl = argv
-        if nextArg == 'ftpUserName':
-            ftpUserName = argv
-        if nextArg == 'ftpPassword':
-            ftpPassword = argv
-        if nextArg == 'ftpTimeout':
-            ftpTimeout = int(argv)
-        if nextArg == 'useSSH':
-            useSSH = argv == 'True'
-        if nextArg == 'srcFileNames':
-            srcFileNames = argv.split(',')
-        if nextArg == 'srcPathName':
-            srcPathName = argv
-        nextArg = ''
-    else:
-        if argv.lower() == '--ftpurl' or argv.lower() == '-ftpurl':
-            nextArg = 'ftpUrl'
-        if argv.lower() == '--ftpusername' or argv.lower() == '-ftpusername':
-            nextArg = 'ftpUserName'
-        if argv.lower() == '--ftppassword' or argv.lower() == '-ftppassword':
-            nextArg = 'ftpPassword'
-        if argv.lower() == '--ftptimeout' or argv.lower() == '-ftptimeout':
-            nextArg = 'ftpTimeout'
-        if argv.lower() == '--usessh' or argv.lower() == '-usessh':
-            nextArg = 'useSSH'
-        if argv.lower() == '--srcfilenames' or argv.lower() == '-srcfilenames':
-            nextArg = 'srcFileNames'
-        if argv.lower() == '--srcpathname' or argv.lower() == '-srcpathname':
-            nextArg = 'srcPathName'
+# when True, report how long each
+# deferred module import has taken
+profileStartup = False
+
+# deferred module imports, keyed by module
+# name, and the seconds each took to import
+importedModules = {}
+moduleImportTimes = {}
 
 # ==============================
 # implement minimum log filter
@@ -116,16 +108,355 @@ class MaxLogLevelFilter(logging.Filter):
         return record.levelno <= self.level
 
 
+# ================================
+# Outcome of pushing a single file
+# ================================
+class PushResult(object):
+    '''
+    Push Result class
+    '''
+    def __init__(self, srcFileName, errStr=None, elapsedSeconds=0.0):
+        '''
+
+        :param srcFileName:
+        :param errStr:
+        :param elapsedSeconds:
+        '''
+        self.srcFileName = srcFileName
+        self.errStr = errStr
+        self.elapsedSeconds = elapsedSeconds
+
+    @property
+    def successful(self):
+        '''
+        True if the file was pushed without error
+        '''
+        return self.errStr is None
+
+    def __repr__(self):
+        return 'PushResult(srcFileName=%r, errStr=%r, elapsedSeconds=%.3f)' % (self.srcFileName,
+                                                                               self.errStr,
+                                                                               self.elapsedSeconds)
+
+
+# =====================================
+# A source file readied for its upload,
+# via the spool folder if one is in use
+# =====================================
+class StagedFile(object):
+    '''
+    Staged File class
+    '''
+    def __init__(self, srcFileName, stgFileName=None, srcStat=None, errStr=None, elapsedSeconds=0.0):
+        '''
+
+        :param srcFileName:
+        :param stgFileName: the spool copy, None if not staged
+        :param srcStat: the source's os.stat() when it was staged
+        :param errStr:
+        :param elapsedSeconds:
+        '''
+        self.srcFileName = srcFileName
+        self.stgFileName = stgFileName
+        self.srcStat = srcStat
+        self.errStr = errStr
+        self.elapsedSeconds = elapsedSeconds
+
+
+# =====================================
+# Push batches of files to an FTP site,
+# reusing one connection across batches
+# =====================================
+class Pusher(object):
+    '''
+    Pusher class, for calling the pusher in-process:
+
+        with Pusher(ftpUrl, ftpUserName, ftpPassword) as pusher:
+            for pushResult in pusher.pushBatch(srcFileNames):
+                ...
+    '''
+    def __init__(self,
+                 ftpUrl,
+                 ftpUserName=None,
+                 ftpPassword=None,
+                 ftpTimeout=15,
+                 useSSH=False,
+                 ftpPath=None,
+                 deleteFilesOnUpload=False,
+                 createPathIfNonExistant=True,
+                 removePreExistingFtpFiles=False,
+                 srcPathName=None,
+                 spoolPathName=None,
+                 useDeltaTransfer=False,
+                 deltaSigPathName=deltaSigPathName,
+                 probeIdleSeconds=5,
+                 stageChunkSize=None,
+                 pgmLogger=logging,
+                 isTestMode=False):
+        '''
+
+        :param ftpUrl:
+        :param ftpUserName:
+        :param ftpPassword: if None then pull password from keyring
+        :param ftpTimeout:
+        :param useSSH:
+        :param ftpPath:
+        :param deleteFilesOnUpload:
+        :param createPathIfNonExistant:
+        :param removePreExistingFtpFiles:
+        :param srcPathName: parent path of any relative source paths
+        :param spoolPathName: if specified, files are staged into
+                              this folder and uploaded from there
+        :param useDeltaTransfer: if True, SFTP uploads only send changed blocks
+        :param deltaSigPathName: folder of the cached block signatures
+        :param probeIdleSeconds: an open connection idle for longer
+                                 than this is probed before it is reused
+        :param stageChunkSize: how many files of a batch are staged ahead
+                               of their uploads, None for the whole batch
+        :param pgmLogger:
+        :param isTestMode:
+        '''
+        self.ftpUrl = ftpUrl
+        self.ftpUserName = ftpUserName
+        self.ftpPassword = ftpPassword
+        self.ftpTimeout = ftpTimeout
+        self.useSSH = useSSH
+        self.ftpPath = ftpPath
+        self.deleteFilesOnUpload = deleteFilesOnUpload
+        self.createPathIfNonExistant = createPathIfNonExistant
+        self.removePreExistingFtpFiles = removePreExistingFtpFiles
+        self.srcPathName = srcPathName
+        self.spoolPathName = spoolPathName
+        self.useDeltaTransfer = useDeltaTransfer
+        self.deltaSigPathName = deltaSigPathName
+        self.probeIdleSeconds = probeIdleSeconds
+        self.stageChunkSize = stageChunkSize
+        self.pgmLogger = pgmLogger
+        self.isTestMode = isTestMode
+        self.ftpConn = None
+        self.ftpConnUsedTime = None
+
+        if spoolPathName is not None:
+            # remove whatever runs that were
+            # killed mid-upload left staged
+            cleanSpoolPath(spoolPathName,
+                           pgmLogger=pgmLogger)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def connect(self):
+        '''
+        Open the connection, if it is not already open,
+        or reopen it if it has gone stale while idle
+        '''
+        errStr = None
+
+        if self.ftpConn is not None and \
+           time.perf_counter() - self.ftpConnUsedTime > self.probeIdleSeconds:
+            errStr = self.probe()
+            if errStr is not None:
+                self.pgmLogger.warning("FTP connection is stale, reconnecting: %s" % errStr)
+                self.close()
+                errStr = None
+
+        if self.ftpConn is None:
+            self.ftpConn, errStr = getFtpConn(ftpUrl=self.ftpUrl,
+                                              ftpUserName=self.ftpUserName,
+                                              ftpPassword=self.ftpPassword,
+                                              ftpTimeout=self.ftpTimeout,
+                                              useSSH=self.useSSH,
+                                              pgmLogger=self.pgmLogger,
+                                              isTestMode=self.isTestMode)
+
+        self.ftpConnUsedTime = time.perf_counter()
+
+        return errStr
+
+    def probe(self):
+        '''
+        Round-trip a no-op command over the open connection
+        '''
+        errStr = None
+
+        try:
+            if self.useSSH:
+                self.ftpConn.pwd
+            else:
+                self.ftpConn.keep_alive()
+        except Exception as err:
+            errStr = str(err)
+
+        return errStr
+
+    def close(self):
+        '''
+        Close the connection, if it is open
+        '''
+        errStr = None
+
+        if self.ftpConn is not None:
+            errStr = clsFtpConn(self.ftpConn,
+                                pgmLogger=self.pgmLogger,
+                                isTestMode=self.isTestMode)
+            self.ftpConn = None
+
+        return errStr
+
+    def stage(self, srcFileName):
+        '''
+        Stage one file into the spool folder, if one
+        is in use, returning its StagedFile
+
+        :param srcFileName:
+        '''
+        startTime = time.perf_counter()
+
+        srcFileNameExpanded = getPathExpanded(srcFileName, self.srcPathName)
+
+        stgFileName = None
+        srcStat = None
+
+        if os.path.exists(srcFileNameExpanded):
+            errStr = None
+            if self.spoolPathName is not None:
+                stgFileName, srcStat, errStr = stageFile(srcFileNameExpanded,
+                                                         self.spoolPathName,
+                                                         pgmLogger=self.pgmLogger)
+        else:
+            errStr = "srcFileName does not exist: %s" % srcFileNameExpanded
+            self.pgmLogger.error(errStr)
+
+        return StagedFile(srcFileNameExpanded, stgFileName, srcStat, errStr,
+                          time.perf_counter() - startTime)
+
+    def upload(self, stagedFile):
+        '''
+        Upload one StagedFile, from the spool folder if it
+        was staged there, returning its PushResult
+
+        :param stagedFile:
+        '''
+        startTime = time.perf_counter()
+
+        errStr = stagedFile.errStr
+
+        if stagedFile.stgFileName is not None:
+            # upload the snapshot, the source is
+            # only deleted after a successful upload
+            uplFileName = stagedFile.stgFileName
+            deleteFilesOnUpload = False
+        else:
+            uplFileName = stagedFile.srcFileName
+            deleteFilesOnUpload = self.deleteFilesOnUpload
+
+        try:
+            if errStr is None:
+                errStr = self.connect()
+            if errStr is None:
+                try:
+                    errStr = putFtpFile(srcFileName=uplFileName,
+                                        ftpUrl=self.ftpUrl,
+                                        ftpUserName=self.ftpUserName,
+                                        ftpPassword=self.ftpPassword,
+                                        ftpTimeout=self.ftpTimeout,
+                                        useSSH=self.useSSH,
+                                        ftpPath=self.ftpPath,
+                                        deleteFilesOnUpload=deleteFilesOnUpload,
+                                        pgmLogger=self.pgmLogger,
+                                        isTestMode=self.isTestMode,
+                                        createPathIfNonExistant=self.createPathIfNonExistant,
+                                        removePreExistingFtpFiles=self.removePreExistingFtpFiles,
+                                        ftpConn=self.ftpConn,
+                                        useDeltaTransfer=self.useDeltaTransfer,
+                                        deltaSigPathName=self.deltaSigPathName)
+                except Exception as err:
+                    # e.g. a dropped connection, which must
+                    # not end the rest of the batch
+                    errStr = str(err) or err.__class__.__name__
+                    self.pgmLogger.error('FTP UPLOAD failure of local file %s: %s' % (uplFileName, errStr))
+                if errStr is not None:
+                    # the connection may be broken,
+                    # so reopen it for the next file
+                    self.close()
+                else:
+                    self.ftpConnUsedTime = time.perf_counter()
+        finally:
+            if stagedFile.stgFileName is not None:
+                unstageFile(stagedFile.stgFileName,
+                            pgmLogger=self.pgmLogger)
+
+        if errStr is None and stagedFile.stgFileName is not None and self.deleteFilesOnUpload:
+            errStr = deleteFileIfUnchanged(stagedFile.srcFileName,
+                                           stagedFile.srcStat,
+                                           pgmLogger=self.pgmLogger)
+
+        return PushResult(stagedFile.srcFileName, errStr,
+                          stagedFile.elapsedSeconds + time.perf_counter() - startTime)
+
+    def pushFile(self, srcFileName):
+        '''
+        Push one file, returning its PushResult
+
+        :param srcFileName:
+        '''
+        return self.upload(self.stage(srcFileName))
+
+    def pushBatch(self, srcFileNames):
+        '''
+        Push each file of an iterable (or generator)
+        of source paths, yielding each file's
+        PushResult as soon as it has completed.
+
+        With a spool folder, every file of the batch
+        (or of each stageChunkSize chunk of it) is
+        staged before any of them is uploaded, so
+        that producers never wait on the FTP site.
+
+        :param srcFileNames:
+        '''
+        if self.spoolPathName is None:
+            for srcFileName in srcFileNames:
+                yield self.pushFile(srcFileName)
+            return
+
+        srcFileNames = iter(srcFileNames)
+        while True:
+            stagedFiles = [self.stage(srcFileName)
+                           for srcFileName in itertools.islice(srcFileNames, self.stageChunkSize)]
+            if not stagedFiles:
+                break
+            try:
+                while stagedFiles:
+                    yield self.upload(stagedFiles.pop(0))
+            finally:
+                # if the caller stops early, unstage
+                # the files that were never uploaded
+                for stagedFile in stagedFiles:
+                    if stagedFile.stgFileName is not None:
+                        unstageFile(stagedFile.stgFileName,
+                                    pgmLogger=self.pgmLogger)
+
+
 # ==========================
 # Mainline execution routine
 # ==========================
-def main(isTestMode=False):
+def main(isTestMode=False,
+         argv=None):
     '''
 
-    :param pgmLogger:
     :param isTestMode:
+    :param argv:
     '''
 
+    # obtain any command-line arguments
+    # overriding any values set so far
+    getCmdLineArgs(sys.argv if argv is None else argv)
+
     # set the default logger's values
     logging.basicConfig(level=logging.INFO,
                         format=dftMsgFormat,
@@ -157,45 +488,152 @@ def main(isTestMode=False):
 
     logger.setLevel(nmlLogLevel)
 
+    pusher = Pusher(ftpUrl=ftpUrl,
+                    ftpUserName=ftpUserName,
+                    ftpPassword=ftpPassword,
+                    ftpTimeout=ftpTimeout,
+                    useSSH=useSSH,
+                    ftpPath=ftpPath,
+                    deleteFilesOnUpload=ftpDeleteFilesOnUpload,
+                    createPathIfNonExistant=ftpCreatePathIfNonExistant,
+                    removePreExistingFtpFiles=ftpRemovePreExistingFtpFiles,
+                    srcPathName=srcPathName,
+                    spoolPathName=spoolPathName,
+                    useDeltaTransfer=useDeltaTransfer,
+                    deltaSigPathName=deltaSigPathName,
+                    pgmLogger=logger,
+                    isTestMode=isTestMode)
+
     # can the program connect to the FTP site?
-    ftpConn, errStr = getFtpConn(ftpUrl=ftpUrl,
-                                 ftpUserName=ftpUserName,
-                                 ftpPassword=ftpPassword,
-                                 ftpTimeout=ftpTimeout,
-                                 useSSH=useSSH,
-                                 pgmLogger=logger,
-                                 isTestMode=isTestMode)
-
-    if ftpConn is not None:
-        # can the program
-        # close the FTP site?
-        errStr = clsFtpConn(ftpConn,
-                            pgmLogger=logger,
-                            isTestMode=isTestMode)
+    errStr = pusher.connect()
 
     if errStr is None:
         # source file by source file
         # push the files to the FTP site
-        for srcFileName in srcFileNames:
-            srcFileNameExpanded = getPathExpanded(srcFileName, srcPathName)
-            if os.path.exists(srcFileNameExpanded):
-                errStr = putFtpFile(srcFileName=srcFileNameExpanded,
-                                    ftpUrl=ftpUrl,
-                                    ftpUserName=ftpUserName,
-                                    ftpPassword=ftpPassword,
-                                    ftpTimeout=ftpTimeout,
-                                    useSSH=useSSH,
-                                    ftpPath=ftpPath,
-                                    deleteFilesOnUpload=ftpDeleteFilesOnUpload,
-                                    pgmLogger=logger,
-                                    isTestMode=isTestMode)
-            else:
-                errStr = "srcFileName does not exist: %s" % srcFileNameExpanded
-                logger.error(errStr)
+        for pushResult in pusher.pushBatch(srcFileNames):
+            errStr = pushResult.errStr
+
+    # can the program
+    # close the FTP site?
+    clsErrStr = pusher.close()
+    if errStr is None:
+        errStr = clsErrStr
+
+    if profileStartup:
+        logImportTimes(pgmLogger=logger)
 
     return errStr
 
 
+# ==================================
+# Obtain any command-line arguments,
+# overriding the module-level values
+# ==================================
+def getCmdLineArgs(argvs):
+    '''
+
+    :param argvs:
+    '''
+
+    global ftpUrl, ftpUserName, ftpPassword, ftpTimeout
+    global useSSH, srcFileNames, srcPathName, spoolPathName, profileStartup
+    global useDeltaTransfer, deltaSigPathName
+
+    nextArg = ''
+    for argv in argvs:
+        if nextArg != '':
+            if nextArg == 'ftpUrl':
+                ftpUrl = argv
+            if nextArg == 'ftpUserName':
+                ftpUserName = argv
+            if nextArg == 'ftpPassword':
+                ftpPassword = argv
+            if nextArg == 'ftpTimeout':
+                ftpTimeout = int(argv)
+            if nextArg == 'useSSH':
+                useSSH = argv == 'True'
+            if nextArg == 'srcFileNames':
+                srcFileNames = argv.split(',')
+            if nextArg == 'srcPathName':
+                srcPathName = argv
+            if nextArg == 'spoolPathName':
+                spoolPathName = argv
+            if nextArg == 'useDeltaTransfer':
+                useDeltaTransfer = argv == 'True'
+            if nextArg == 'deltaSigPathName':
+                deltaSigPathName = argv
+            nextArg = ''
+        else:
+            if argv.lower() == '--ftpurl' or argv.lower() == '-ftpurl':
+                nextArg = 'ftpUrl'
+            if argv.lower() == '--ftpusername' or argv.lower() == '-ftpusername':
+                nextArg = 'ftpUserName'
+            if argv.lower() == '--ftppassword' or argv.lower() == '-ftppassword':
+                nextArg = 'ftpPassword'
+            if argv.lower() == '--ftptimeout' or argv.lower() == '-ftptimeout':
+                nextArg = 'ftpTimeout'
+            if argv.lower() == '--usessh' or argv.lower() == '-usessh':
+                nextArg = 'useSSH'
+            if argv.lower() == '--srcfilenames' or argv.lower() == '-srcfilenames':
+                nextArg = 'srcFileNames'
+            if argv.lower() == '--srcpathname' or argv.lower() == '-srcpathname':
+                nextArg = 'srcPathName'
+            if argv.lower() == '--spoolpathname' or argv.lower() == '-spoolpathname':
+                nextArg = 'spoolPathName'
+            if argv.lower() == '--usedeltatransfer' or argv.lower() == '-usedeltatransfer':
+                nextArg = 'useDeltaTransfer'
+            if argv.lower() == '--deltasigpathname' or argv.lower() == '-deltasigpathname':
+                nextArg = 'deltaSigPathName'
+            # a flag, it takes no value
+            if argv.lower() == '--profile-startup' or argv.lower() == '-profile-startup':
+                profileStartup = True
+
+
+# ===================================
+# Import the specified module on its
+# first use, timing how long it takes
+# ===================================
+def getModule(moduleName,
+              pgmLogger=logging):
+    '''
+
+    :param moduleName:
+    :param pgmLogger:
+    '''
+
+    module = importedModules.get(moduleName)
+
+    if module is None:
+        startTime = time.perf_counter()
+        module = importlib.import_module(moduleName)
+        elapsed = time.perf_counter() - startTime
+        importedModules[moduleName] = module
+        moduleImportTimes[moduleName] = elapsed
+        if profileStartup:
+            pgmLogger.info('IMPORT of module "%s" took %.3f seconds' % (moduleName, elapsed))
+
+    return module
+
+
+# =================================
+# Log the time each deferred module
+# import took, slowest module first
+# =================================
+def logImportTimes(pgmLogger=logging):
+    '''
+
+    :param pgmLogger:
+    '''
+
+    totalTime = 0.0
+    for moduleName, elapsed in sorted(moduleImportTimes.items(),
+                                      key=lambda item: item[1],
+                                      reverse=True):
+        pgmLogger.info('IMPORT time: %.3f seconds for module "%s"' % (elapsed, moduleName))
+        totalTime += elapsed
+    pgmLogger.info('IMPORT time: %.3f seconds in total for %d module(s)' % (totalTime, len(moduleImportTimes)))
+
+
 # ==================================
 # Close the specified FTP connection
 # ==================================
@@ -214,7 +652,7 @@ def clsFtpConn(ftpConn,
     if ftpConn != None:
         try:
             ftpConn.close()
-        except FTPError as err:
+        except Exception as err:
             errStr = str(err)
             pgmLogger.error("CLOSE of FTP connection encountered an error: %s" % (errStr))
 
@@ -246,12 +684,14 @@ def getFtpConn(ftpUrl,
     ftpConn = None
 
     if ftpPassword is None:
-        password, errStr = getPwdViaKeyring(ftpUrl, ftpUserName, True)
+        password, errStr = getPwdViaKeyring(ftpUrl, ftpUserName, True,
+                                            pgmLogger=pgmLogger)
     else:
         password = ftpPassword
 
     if errStr is None:
         if useSSH:
+            pysftp = getModule('pysftp', pgmLogger)
             try:
                 ftpConn = pysftp.Connection(ftpUrl, username=ftpUserName, password=password)
                 ftpConn.timeout = ftpTimeout
@@ -259,9 +699,11 @@ def getFtpConn(ftpUrl,
                 errStr = str(err)
                 pgmLogger.error("SFTP connection encountered an error: %s" % (errStr))
         else:
+            ftputil = getModule('ftputil', pgmLogger)
+            ftputilError = getModule('ftputil.error', pgmLogger)
             try:
                 ftpConn = ftputil.FTPHost(ftpUrl, ftpUserName, password)
-            except FTPError as err:
+            except ftputilError.FTPError as err:
                 errStr = str(err)
                 pgmLogger.error("FTP connection encountered an error: %s" % (errStr))
 
@@ -280,7 +722,12 @@ def putFtpFile(srcFileName,
                ftpPath=ftpPath,
                deleteFilesOnUpload=False,
                pgmLogger=logging,
-               isTestMode=False):
+               isTestMode=False,
+               createPathIfNonExistant=ftpCreatePathIfNonExistant,
+               removePreExistingFtpFiles=ftpRemovePreExistingFtpFiles,
+               ftpConn=None,
+               useDeltaTransfer=False,
+               deltaSigPathName=deltaSigPathName):
     '''
 
     :param srcFileName:
@@ -293,10 +740,15 @@ def putFtpFile(srcFileName,
     :param deleteFilesOnUpload:
     :param pgmLogger:
     :param isTestMode:
+    :param createPathIfNonExistant:
+    :param removePreExistingFtpFiles:
+    :param ftpConn: if specified, an already open connection
+                    which is used, and left open, for the upload
+    :param useDeltaTransfer: if True, SFTP uploads only send changed blocks
+    :param deltaSigPathName:
     '''
 
     errStr = None
-    successful = False
 
     if useSSH:
         errStr = putFtpFileViaPysftp(srcFileName=srcFileName,
@@ -308,7 +760,12 @@ def putFtpFile(srcFileName,
                                      ftpPath=ftpPath,
                                      deleteFilesOnUpload=deleteFilesOnUpload,
                                      pgmLogger=pgmLogger,
-                                     isTestMode=isTestMode)
+                                     isTestMode=isTestMode,
+                                     createPathIfNonExistant=createPathIfNonExistant,
+                                     removePreExistingFtpFiles=removePreExistingFtpFiles,
+                                     ftpConn=ftpConn,
+                                     useDeltaTransfer=useDeltaTransfer,
+                                     deltaSigPathName=deltaSigPathName)
     else:
         errStr = putFtpFileViaFtpUtil(srcFileName=srcFileName,
                                       ftpUrl=ftpUrl,
@@ -319,7 +776,10 @@ def putFtpFile(srcFileName,
                                       ftpPath=ftpPath,
                                       deleteFilesOnUpload=deleteFilesOnUpload,
                                       pgmLogger=pgmLogger,
-                                      isTestMode=isTestMode)
+                                      isTestMode=isTestMode,
+                                      createPathIfNonExistant=createPathIfNonExistant,
+                                      removePreExistingFtpFiles=removePreExistingFtpFiles,
+                                      ftpConn=ftpConn)
 
     return errStr
 
@@ -336,7 +796,10 @@ def putFtpFileViaFtpUtil(srcFileName,
                          ftpPath=ftpPath,
                          deleteFilesOnUpload=False,
                          pgmLogger=None,
-                         isTestMode=False):
+                         isTestMode=False,
+                         createPathIfNonExistant=ftpCreatePathIfNonExistant,
+                         removePreExistingFtpFiles=ftpRemovePreExistingFtpFiles,
+                         ftpConn=None):
     '''
 
     :param srcFileName:
@@ -349,9 +812,17 @@ def putFtpFileViaFtpUtil(srcFileName,
     :param deleteFilesOnUpload:
     :param pgmLogger:
     :param isTestMode:
+    :param createPathIfNonExistant:
+    :param removePreExistingFtpFiles:
+    :param ftpConn:
     '''
 
     errStr = None
+    ftpFileFullPath = None
+
+    # only close the connection
+    # if it was opened here
+    closeFtpConn = ftpConn is None
 
     if ftpPath is None:
         ftpPath = ''
@@ -362,7 +833,7 @@ def putFtpFileViaFtpUtil(srcFileName,
         errStr = 'File "%s" does NOT exist, put of file to FTP site FAILED.' % srcFileNameExpanded
         pgmLogger.error(errStr)
 
-    if errStr is None:
+    if errStr is None and ftpConn is None:
         ftpConn, errStr = getFtpConn(ftpUrl,
                                      ftpUserName,
                                      ftpPassword,
@@ -388,7 +859,7 @@ def putFtpFileViaFtpUtil(srcFileName,
             # if the modified ftpPath does not exist
             if not ftpConn.path.exists(ftpPathTemp):
                 pgmLogger.warning('FTP PATH (modified) "%s" does NOT exist!' % ftpPathTemp)
-                if ftpCreatePathIfNonExistant:
+                if createPathIfNonExistant:
                     # reset ftpPath value
                     ftpPathTemp = ftpPath
                     try:
@@ -430,10 +901,11 @@ def putFtpFileViaFtpUtil(srcFileName,
         # temporary ftpPath that "worked"
         ftpPath = ftpPathTemp
 
-    baseName = os.path.basename(srcFileNameExpanded)
-    ftpFileFullPath = ftpConn.path.join(ftpPath, baseName)
+    if errStr is None:
+        baseName = os.path.basename(srcFileNameExpanded)
+        ftpFileFullPath = ftpConn.path.join(ftpPath, baseName)
 
-    if errStr is None and ftpRemovePreExistingFtpFiles:
+    if errStr is None and removePreExistingFtpFiles:
         if ftpConn.path.exists(ftpFileFullPath):
             try:
                 ftpConn.remove(ftpFileFullPath)
@@ -465,7 +937,7 @@ def putFtpFileViaFtpUtil(srcFileName,
                 pgmLogger.error('DELETE of file: "%s" FAILED after UPLOAD to FTP path "%s"' % (srcFileNameExpanded, ftpFileFullPath))
                 pgmLogger.error(errStr)
 
-    if ftpConn != None:
+    if ftpConn != None and closeFtpConn:
         try:
             ftpConn.close()
         except Exception as err:
@@ -488,7 +960,12 @@ def putFtpFileViaPysftp(srcFileName,
                         ftpPath=ftpPath,
                         deleteFilesOnUpload=False,
                         pgmLogger=None,
-                        isTestMode=False):
+                        isTestMode=False,
+                        createPathIfNonExistant=ftpCreatePathIfNonExistant,
+                        removePreExistingFtpFiles=ftpRemovePreExistingFtpFiles,
+                        ftpConn=None,
+                        useDeltaTransfer=False,
+                        deltaSigPathName=deltaSigPathName):
     '''
 
     :param srcFileName:
@@ -501,9 +978,19 @@ def putFtpFileViaPysftp(srcFileName,
     :param deleteFilesOnUpload:
     :param pgmLogger:
     :param isTestMode:
+    :param createPathIfNonExistant:
+    :param removePreExistingFtpFiles:
+    :param ftpConn:
+    :param useDeltaTransfer:
+    :param deltaSigPathName:
     '''
 
     errStr = None
+    ftpFileFullPath = None
+
+    # only close the connection
+    # if it was opened here
+    closeFtpConn = ftpConn is None
 
     if ftpPath is None:
         ftpPath = ''
@@ -514,7 +1001,7 @@ def putFtpFileViaPysftp(srcFileName,
         errStr = 'File "%s" does NOT exist, put of file to FTP site FAILED.' % srcFileNameExpanded
         pgmLogger.error(errStr)
 
-    if errStr is None:
+    if errStr is None and ftpConn is None:
         ftpConn, errStr = getFtpConn(ftpUrl,
                                      ftpUserName,
                                      ftpPassword,
@@ -540,7 +1027,7 @@ def putFtpFileViaPysftp(srcFileName,
             # if the modified ftpPath does not exist
             if not ftpConn.exists(ftpPathTemp):
                 pgmLogger.warning('FTP PATH (modified) "%s" does NOT exist!' % ftpPathTemp)
-                if ftpCreatePathIfNonExistant:
+                if createPathIfNonExistant:
                     # reset ftpPath value
                     ftpPathTemp = ftpPath
                     try:
@@ -581,10 +1068,11 @@ def putFtpFileViaPysftp(srcFileName,
         # temporary ftpPath that "worked"
         ftpPath = ftpPathTemp
 
-    baseName = os.path.basename(srcFileNameExpanded)
-    ftpFileFullPath = ftpPath + '/' + baseName
+    if errStr is None:
+        baseName = os.path.basename(srcFileNameExpanded)
+        ftpFileFullPath = ftpPath + '/' + baseName
 
-    if errStr is None and ftpRemovePreExistingFtpFiles:
+    if errStr is None and removePreExistingFtpFiles:
         if ftpConn.exists(ftpFileFullPath):
             try:
                 ftpConn.remove(ftpFileFullPath)
@@ -595,14 +1083,27 @@ def putFtpFileViaPysftp(srcFileName,
                 pgmLogger.error(errStr)
 
     if errStr is None:
-        try:
-            with ftpConn.cd(ftpPath):
-                ftpConn.put(srcFileNameExpanded)
-            pgmLogger.info('FTP UPLOAD success of local file: "%s" to FTP path "%s":' % (srcFileNameExpanded, ftpFileFullPath))
-        except Exception as err:
-            errStr = str(err)
-            pgmLogger.error("FTP UPLOAD failure of local file %s to FTP path: %s" % (srcFileNameExpanded, ftpFileFullPath))
-            pgmLogger.error(errStr)
+        # a removed remote file
+        # leaves nothing to patch
+        if useDeltaTransfer and not removePreExistingFtpFiles:
+            sigFileName = getSignatureFileName(deltaSigPathName,
+                                               ftpUrl,
+                                               ftpUserName,
+                                               ftpFileFullPath)
+            errStr = putFtpFileDeltaViaPysftp(ftpConn,
+                                              srcFileNameExpanded,
+                                              ftpFileFullPath,
+                                              sigFileName,
+                                              pgmLogger=pgmLogger)
+        else:
+            try:
+                with ftpConn.cd(ftpPath):
+                    ftpConn.put(srcFileNameExpanded)
+                pgmLogger.info('FTP UPLOAD success of local file: "%s" to FTP path "%s":' % (srcFileNameExpanded, ftpFileFullPath))
+            except Exception as err:
+                errStr = str(err)
+                pgmLogger.error("FTP UPLOAD failure of local file %s to FTP path: %s" % (srcFileNameExpanded, ftpFileFullPath))
+                pgmLogger.error(errStr)
 
     if errStr is None:
         if deleteFilesOnUpload:
@@ -615,7 +1116,7 @@ def putFtpFileViaPysftp(srcFileName,
                 pgmLogger.error('DELETE of file: "%s" FAILED after UPLOAD to FTP path "%s"' % (srcFileNameExpanded, ftpFileFullPath))
                 pgmLogger.error(errStr)
 
-    if ftpConn != None:
+    if ftpConn != None and closeFtpConn:
         try:
             ftpConn.close()
         except Exception as err:
@@ -626,6 +1127,480 @@ def putFtpFileViaPysftp(srcFileName,
     return errStr
 
 
+# =============================================
+# Upload only the changed blocks of an FTP file
+# to an SFTP site, via cached block signatures
+# =============================================
+def putFtpFileDeltaViaPysftp(ftpConn,
+                             srcFileNameExpanded,
+                             ftpFileFullPath,
+                             sigFileName,
+                             blockSize=deltaBlockSize,
+                             pgmLogger=logging):
+    '''
+    If the remote file still matches the signature
+    cached by its last push, only its changed blocks
+    are sent, otherwise the whole file is uploaded.
+    The cached signature hashes the bytes as they are
+    sent, so it describes the remote file even if the
+    local file changes during the push.
+
+    To be patched, the remote file is renamed to a
+    temporary ".delta" file and renamed back once it
+    is patched, so the FTP path never holds a half-
+    patched file. NOTE: the file is therefore missing
+    from its FTP path while it is being patched, and
+    after a failed patch until the next push. A failed
+    patch keeps the ".delta" file, with a signature
+    that marks the blocks being patched as unknown,
+    and the next push resumes patching it. A push with
+    no changed blocks leaves the remote file alone.
+
+    :param ftpConn: an open pysftp connection
+    :param srcFileNameExpanded:
+    :param ftpFileFullPath:
+    :param sigFileName:
+    :param blockSize:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+    isUnchanged = False
+    ftpTempFullPath = ftpFileFullPath + '.delta'
+
+    oldSignature = loadSignature(sigFileName, pgmLogger=pgmLogger)
+
+    if oldSignature is not None and oldSignature['blockSize'] != blockSize:
+        pgmLogger.warning('Signature file "%s" has a different block size' % sigFileName)
+        oldSignature = None
+
+    # the cached signature is only trusted if the remote
+    # file has not been changed since it was last pushed
+    isResume = False
+    if oldSignature is not None:
+        try:
+            if oldSignature.get('ftpTempFullPath') is not None:
+                # an earlier patch failed, resume it
+                # if its ".delta" file is still there
+                if ftpConn.exists(ftpTempFullPath) and not ftpConn.exists(ftpFileFullPath):
+                    isResume = True
+                    pgmLogger.warning('FTP file "%s" will have its interrupted patch resumed' % ftpTempFullPath)
+                else:
+                    pgmLogger.warning('FTP file "%s" can NOT have its interrupted patch resumed' % ftpTempFullPath)
+                    oldSignature = None
+                    if ftpConn.exists(ftpTempFullPath):
+                        ftpConn.remove(ftpTempFullPath)
+            else:
+                ftpStat = ftpConn.stat(ftpFileFullPath)
+                if oldSignature['remoteSize'] != ftpStat.st_size or \
+                   oldSignature['remoteMtime'] != ftpStat.st_mtime:
+                    pgmLogger.warning('FTP file "%s" does NOT match its cached signature' % ftpFileFullPath)
+                    oldSignature = None
+        except Exception:
+            pgmLogger.warning('FTP file "%s" does NOT exist to be patched' % ftpFileFullPath)
+            oldSignature = None
+
+    if oldSignature is None:
+        sentHashes, fileSize, errStr = putFileHashedViaPysftp(ftpConn,
+                                                              srcFileNameExpanded,
+                                                              ftpFileFullPath,
+                                                              blockSize,
+                                                              pgmLogger=pgmLogger)
+        if errStr is not None:
+            # force a full upload next time
+            deleteFileIfItExists(sigFileName, pgmLogger=pgmLogger)
+    else:
+        fileSize = os.path.getsize(srcFileNameExpanded)
+        blockHashes, errStr = getFileBlockHashes(srcFileNameExpanded, blockSize, pgmLogger=pgmLogger)
+        if errStr is None and len(blockHashes) != (fileSize + blockSize - 1) // blockSize:
+            errStr = 'File "%s" changed while it was being hashed' % srcFileNameExpanded
+            pgmLogger.error(errStr)
+
+    if errStr is None and oldSignature is not None:
+        oldHashes = oldSignature['blockHashes']
+        changedRanges = getChangedRanges(oldHashes, blockHashes, blockSize)
+        if not changedRanges and fileSize == oldSignature['fileSize'] and not isResume:
+            isUnchanged = True
+            pgmLogger.info('FTP DELTA UPLOAD skipped, local file: "%s" is unchanged since its push to FTP path "%s"' % (srcFileNameExpanded, ftpFileFullPath))
+        else:
+            errStr, sentHashes = patchFtpFileViaPysftp(ftpConn,
+                                                       srcFileNameExpanded,
+                                                       ftpFileFullPath,
+                                                       ftpTempFullPath,
+                                                       fileSize,
+                                                       changedRanges,
+                                                       oldSignature,
+                                                       sigFileName,
+                                                       isResume,
+                                                       pgmLogger=pgmLogger)
+
+    if errStr is None and not isUnchanged:
+        try:
+            ftpStat = ftpConn.stat(ftpFileFullPath)
+            sigErrStr = saveSignature(sigFileName,
+                                      {'blockSize': blockSize,
+                                       'fileSize': fileSize,
+                                       'blockHashes': sentHashes,
+                                       'remoteSize': ftpStat.st_size,
+                                       'remoteMtime': ftpStat.st_mtime},
+                                      pgmLogger=pgmLogger)
+        except Exception as err:
+            sigErrStr = str(err)
+            pgmLogger.warning('FTP file "%s" signature was NOT cached: %s' % (ftpFileFullPath, sigErrStr))
+        if sigErrStr is not None:
+            # a stale signature must not
+            # be trusted the next time
+            deleteFileIfItExists(sigFileName, pgmLogger=pgmLogger)
+
+    return errStr
+
+
+# ================================================
+# Upload a whole FTP file to an SFTP site, hashing
+# each of its blocks as it is sent
+# ================================================
+def putFileHashedViaPysftp(ftpConn,
+                           srcFileNameExpanded,
+                           ftpFileFullPath,
+                           blockSize=deltaBlockSize,
+                           pgmLogger=logging):
+    '''
+
+    :param ftpConn: an open pysftp connection
+    :param srcFileNameExpanded:
+    :param ftpFileFullPath:
+    :param blockSize:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+    sentHashes = []
+    fileSize = 0
+
+    try:
+        hashlib = getModule('hashlib', pgmLogger)
+        with open(srcFileNameExpanded, 'rb') as srcFile:
+            with ftpConn.open(ftpFileFullPath, 'w') as ftpFile:
+                ftpFile.set_pipelined(True)
+                block = srcFile.read(blockSize)
+                while block:
+                    ftpFile.write(block)
+                    sentHashes.append(hashlib.sha1(block).hexdigest())
+                    fileSize += len(block)
+                    block = srcFile.read(blockSize)
+        pgmLogger.info('FTP UPLOAD success of local file: "%s" to FTP path "%s":' % (srcFileNameExpanded, ftpFileFullPath))
+    except Exception as err:
+        errStr = str(err)
+        pgmLogger.error("FTP UPLOAD failure of local file %s to FTP path: %s" % (srcFileNameExpanded, ftpFileFullPath))
+        pgmLogger.error(errStr)
+
+    return sentHashes, fileSize, errStr
+
+
+# ================================================
+# Write the changed blocks of an FTP file into its
+# copy on an SFTP site, via a ".delta" temporary
+# ================================================
+def patchFtpFileViaPysftp(ftpConn,
+                          srcFileNameExpanded,
+                          ftpFileFullPath,
+                          ftpTempFullPath,
+                          fileSize,
+                          changedRanges,
+                          oldSignature,
+                          sigFileName,
+                          isResume=False,
+                          pgmLogger=logging):
+    '''
+    Returns the error, if any, and the hashes of the
+    patched file's blocks, each either as it was sent
+    or, if it was not sent, as it was cached
+
+    :param ftpConn: an open pysftp connection
+    :param srcFileNameExpanded:
+    :param ftpFileFullPath:
+    :param ftpTempFullPath:
+    :param fileSize:
+    :param changedRanges:
+    :param oldSignature:
+    :param sigFileName:
+    :param isResume: if True, the ".delta" file of
+                     an earlier failed patch is patched
+    :param pgmLogger:
+    '''
+
+    errStr = None
+    blockSize = oldSignature['blockSize']
+    blockCount = (fileSize + blockSize - 1) // blockSize
+
+    sentHashes = list(oldSignature['blockHashes'][:blockCount])
+    sentHashes.extend([None] * (blockCount - len(sentHashes)))
+
+    # until the patch succeeds the blocks being
+    # patched, and the file's size, are unknown
+    pendingHashes = list(oldSignature['blockHashes'])
+    pendingHashes.extend([None] * (blockCount - len(pendingHashes)))
+    for offset, length in changedRanges:
+        for blockNo in range(offset // blockSize, (offset + length) // blockSize):
+            pendingHashes[blockNo] = None
+    if fileSize != oldSignature['fileSize']:
+        # any block past the smaller size may be
+        # cut off, or not yet written, by the patch
+        for blockNo in range(min(fileSize, oldSignature['fileSize']) // blockSize, len(pendingHashes)):
+            pendingHashes[blockNo] = None
+    errStr = saveSignature(sigFileName,
+                           {'blockSize': blockSize,
+                            'fileSize': max(fileSize, oldSignature['fileSize']),
+                            'blockHashes': pendingHashes,
+                            'remoteSize': None,
+                            'remoteMtime': None,
+                            'ftpTempFullPath': ftpTempFullPath},
+                           pgmLogger=pgmLogger)
+
+    ftpTempRenamed = isResume
+    ftpTempPatched = isResume
+    bytesSent = 0
+
+    if errStr is None:
+        try:
+            hashlib = getModule('hashlib', pgmLogger)
+            if not isResume:
+                if ftpConn.exists(ftpTempFullPath):
+                    ftpConn.remove(ftpTempFullPath)
+                ftpConn.rename(ftpFileFullPath, ftpTempFullPath)
+                ftpTempRenamed = True
+            with open(srcFileNameExpanded, 'rb') as srcFile:
+                with ftpConn.open(ftpTempFullPath, 'r+') as ftpFile:
+                    ftpFile.set_pipelined(True)
+                    for offset, length in changedRanges:
+                        srcFile.seek(offset)
+                        ftpFile.seek(offset)
+                        # copy block by block so that a large
+                        # changed range is never held in memory
+                        for blockNo in range(offset // blockSize, (offset + length) // blockSize):
+                            block = srcFile.read(blockSize)
+                            if len(block) != min(blockSize, fileSize - blockNo * blockSize):
+                                raise IOError('File "%s" changed while it was being pushed' % srcFileNameExpanded)
+                            ftpTempPatched = True
+                            ftpFile.write(block)
+                            sentHashes[blockNo] = hashlib.sha1(block).hexdigest()
+                            bytesSent += len(block)
+                    # a resumed file's size is unknown
+                    if isResume or fileSize < oldSignature['fileSize']:
+                        ftpTempPatched = True
+                        ftpFile.truncate(fileSize)
+            ftpConn.rename(ftpTempFullPath, ftpFileFullPath)
+            pgmLogger.info('FTP DELTA UPLOAD success of local file: "%s" to FTP path "%s", %d of %d bytes sent' % (srcFileNameExpanded, ftpFileFullPath, bytesSent, fileSize))
+        except Exception as err:
+            errStr = str(err)
+            pgmLogger.error("FTP DELTA UPLOAD failure of local file %s to FTP path: %s" % (srcFileNameExpanded, ftpFileFullPath))
+            pgmLogger.error(errStr)
+            if ftpTempRenamed and not ftpTempPatched:
+                # nothing was written, so the
+                # original can simply be restored
+                try:
+                    ftpConn.rename(ftpTempFullPath, ftpFileFullPath)
+                    saveSignature(sigFileName, oldSignature, pgmLogger=pgmLogger)
+                    pgmLogger.warning('FTP RENAME success of unpatched file %s back to %s' % (ftpTempFullPath, ftpFileFullPath))
+                except Exception as err:
+                    pgmLogger.error('FTP RENAME failure of unpatched file %s back to %s' % (ftpTempFullPath, ftpFileFullPath))
+                    pgmLogger.error(str(err))
+                    pgmLogger.error("Program will resume the FTP DELTA UPLOAD on the next iteration!")
+            elif ftpTempRenamed:
+                pgmLogger.error("Program will resume the FTP DELTA UPLOAD on the next iteration!")
+            else:
+                # the remote file was never touched
+                saveSignature(sigFileName, oldSignature, pgmLogger=pgmLogger)
+
+    return errStr, sentHashes
+
+
+# ======================================
+# Hash the specified file block by block
+# ======================================
+def getFileBlockHashes(fileNameExpanded,
+                       blockSize=deltaBlockSize,
+                       pgmLogger=logging):
+    '''
+
+    :param fileNameExpanded:
+    :param blockSize:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+    blockHashes = []
+
+    try:
+        hashlib = getModule('hashlib', pgmLogger)
+        with open(fileNameExpanded, 'rb') as srcFile:
+            block = srcFile.read(blockSize)
+            while block:
+                blockHashes.append(hashlib.sha1(block).hexdigest())
+                block = srcFile.read(blockSize)
+    except Exception as err:
+        errStr = str(err)
+        pgmLogger.error('HASH of file: "%s" FAILED' % fileNameExpanded)
+        pgmLogger.error(errStr)
+
+    return blockHashes, errStr
+
+
+# =============================================
+# Obtain the (offset, length) byte ranges of
+# the blocks that differ, merging adjacent ones
+# =============================================
+def getChangedRanges(oldHashes,
+                     newHashes,
+                     blockSize=deltaBlockSize):
+    '''
+
+    :param oldHashes:
+    :param newHashes:
+    :param blockSize:
+    '''
+
+    changedRanges = []
+
+    for blockNo, blockHash in enumerate(newHashes):
+        if blockNo < len(oldHashes) and oldHashes[blockNo] == blockHash:
+            continue
+        offset = blockNo * blockSize
+        if changedRanges and changedRanges[-1][0] + changedRanges[-1][1] == offset:
+            changedRanges[-1] = (changedRanges[-1][0], changedRanges[-1][1] + blockSize)
+        else:
+            changedRanges.append((offset, blockSize))
+
+    return changedRanges
+
+
+# =======================================
+# Obtain the cached signature file's name
+# for the specified FTP site and FTP file
+# =======================================
+def getSignatureFileName(sigPathName,
+                         ftpUrl,
+                         ftpUserName,
+                         ftpFileFullPath):
+    '''
+
+    :param sigPathName:
+    :param ftpUrl:
+    :param ftpUserName:
+    :param ftpFileFullPath:
+    '''
+
+    hashlib = getModule('hashlib')
+
+    key = '%s\t%s\t%s' % (ftpUrl, ftpUserName, ftpFileFullPath)
+    return os.path.join(getPathExpanded(sigPathName),
+                        hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+
+# ==============================================
+# Load a cached signature, None if there is none
+# ==============================================
+def loadSignature(sigFileName,
+                  pgmLogger=logging):
+    '''
+
+    :param sigFileName:
+    :param pgmLogger:
+    '''
+
+    signature = None
+
+    if os.path.exists(sigFileName):
+        try:
+            json = getModule('json', pgmLogger)
+            with open(sigFileName, 'r') as sigFile:
+                signature = json.load(sigFile)
+        except Exception as err:
+            pgmLogger.warning('Signature file "%s" was NOT loaded: %s' % (sigFileName, str(err)))
+
+    if signature is not None and not isSignatureValid(signature):
+        pgmLogger.warning('Signature file "%s" is malformed, it was NOT loaded' % sigFileName)
+        signature = None
+
+    return signature
+
+
+# ==============================================
+# Check a signature has the keys and value types
+# that putFtpFileDeltaViaPysftp() relies on
+# ==============================================
+def isSignatureValid(signature):
+    '''
+
+    :param signature:
+    '''
+
+    if not isinstance(signature, dict):
+        return False
+
+    # the signature of an interrupted patch
+    # has an unknown remote size and mtime
+    isPending = signature.get('ftpTempFullPath') is not None
+    if isPending and not isinstance(signature['ftpTempFullPath'], str):
+        return False
+
+    for key in ('blockSize', 'fileSize'):
+        if not isinstance(signature.get(key), int):
+            return False
+
+    if not (isPending and signature.get('remoteSize') is None) and \
+       not isinstance(signature.get('remoteSize'), int):
+        return False
+
+    if not (isPending and signature.get('remoteMtime') is None) and \
+       not isinstance(signature.get('remoteMtime'), (int, float)):
+        return False
+
+    # an unknown block's hash is None
+    blockHashes = signature.get('blockHashes')
+    if not isinstance(blockHashes, list) or \
+       not all(blockHash is None or isinstance(blockHash, str) for blockHash in blockHashes):
+        return False
+
+    return True
+
+
+# =======================================
+# Save a signature to the signature cache
+# =======================================
+def saveSignature(sigFileName,
+                  signature,
+                  pgmLogger=logging):
+    '''
+    Written to a temporary file then renamed,
+    so that a crash never leaves a torn signature
+
+    :param sigFileName:
+    :param signature:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+
+    sigTempFileName = sigFileName + '.tmp'
+
+    try:
+        sigPathName = os.path.dirname(sigFileName)
+        if not os.path.exists(sigPathName):
+            os.makedirs(sigPathName)
+        json = getModule('json', pgmLogger)
+        with open(sigTempFileName, 'w') as sigFile:
+            json.dump(signature, sigFile)
+        os.replace(sigTempFileName, sigFileName)
+        pgmLogger.info('Signature file "%s" saved successfully' % sigFileName)
+    except Exception as err:
+        errStr = str(err)
+        pgmLogger.error('Signature file "%s" save FAILED' % sigFileName)
+        pgmLogger.error(errStr)
+
+    return errStr
+
+
 # ========================
 # Delete file if it exists
 # ========================
@@ -656,6 +1631,266 @@ def deleteFileIfItExists(fileNameExpanded,
     return errStr
 
 
+# =========================================
+# Stage a source file into the spool folder
+# =========================================
+def stageFile(srcFileNameExpanded,
+              spoolPathName,
+              pgmLogger=logging):
+    '''
+    Reflink-copies (or failing that, hard-links) the
+    source file into its own sub-folder of the spool
+    folder, keeping its base name for the upload.
+    Both need the spool folder to be on the same file
+    system as the source file.
+
+    NOTE: a hard link only snapshots files that their
+    producer replaces (write then rename), not files
+    that their producer rewrites in place, whereas a
+    reflink snapshots either.
+
+    :param srcFileNameExpanded:
+    :param spoolPathName:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+    stgFileName = None
+    srcStat = None
+
+    try:
+        srcStat = os.stat(srcFileNameExpanded)
+        spoolPathExpanded = getPathExpanded(spoolPathName)
+        if not os.path.exists(spoolPathExpanded):
+            os.makedirs(spoolPathExpanded)
+        if os.stat(spoolPathExpanded).st_dev != srcStat.st_dev:
+            errStr = 'SPOOL PATH "%s" is NOT on the same file system as file "%s", it can be neither reflinked nor hard-linked' % (spoolPathExpanded, srcFileNameExpanded)
+            pgmLogger.error(errStr)
+            pgmLogger.error("Program configuration error, the spool path must share the source path's file system!")
+        else:
+            tempfile = getModule('tempfile', pgmLogger)
+            # the process id lets cleanSpoolPath()
+            # tell when its stager is no longer running
+            stgPathName = tempfile.mkdtemp(prefix='stg%d_' % os.getpid(), dir=spoolPathExpanded)
+            stgFileName = os.path.join(stgPathName, os.path.basename(srcFileNameExpanded))
+    except Exception as err:
+        errStr = str(err)
+        pgmLogger.error('STAGE of file: "%s" into spool path "%s" FAILED' % (srcFileNameExpanded, spoolPathName))
+        pgmLogger.error(errStr)
+
+    if errStr is None:
+        # only try a reflink on file systems
+        # not yet known to lack support for it
+        if srcStat.st_dev not in reflinkUnsupportedDevs and \
+           reflinkFile(srcFileNameExpanded, stgFileName, pgmLogger=pgmLogger) is None:
+            pgmLogger.info('STAGE of file: "%s" as reflink "%s" SUCCEEDED' % (srcFileNameExpanded, stgFileName))
+        else:
+            try:
+                os.link(srcFileNameExpanded, stgFileName)
+                pgmLogger.info('STAGE of file: "%s" as hard link "%s" SUCCEEDED' % (srcFileNameExpanded, stgFileName))
+            except OSError as err:
+                errStr = str(err)
+                pgmLogger.error('STAGE of file: "%s" as hard link "%s" FAILED' % (srcFileNameExpanded, stgFileName))
+                pgmLogger.error(errStr)
+                unstageFile(stgFileName, pgmLogger=pgmLogger)
+                stgFileName = None
+
+    return stgFileName, srcStat, errStr
+
+
+# =======================================
+# Copy a file via a copy-on-write reflink
+# =======================================
+def reflinkFile(srcFileNameExpanded,
+                tgtFileNameExpanded,
+                pgmLogger=logging):
+    '''
+    Only supported on Linux file systems
+    with copy-on-write, e.g. btrfs and xfs.
+    A file system that turns out not to support
+    it is added to reflinkUnsupportedDevs.
+
+    :param srcFileNameExpanded:
+    :param tgtFileNameExpanded:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+    srcDev = None
+
+    # FICLONE ioctl request code, from linux/fs.h
+    ficlone = 0x40049409
+
+    errno = getModule('errno', pgmLogger)
+
+    # errors that will recur for every file on the file
+    # system, unlike transient ones such as EPERM or ENOSPC;
+    # ENOTTY is what non-Linux systems give for FICLONE
+    unsupportedErrNos = (errno.EOPNOTSUPP, errno.EINVAL, errno.EXDEV, errno.ENOTTY)
+
+    try:
+        srcDev = os.stat(srcFileNameExpanded).st_dev
+        fcntl = getModule('fcntl', pgmLogger)
+        with open(srcFileNameExpanded, 'rb') as srcFile:
+            with open(tgtFileNameExpanded, 'wb') as tgtFile:
+                fcntl.ioctl(tgtFile.fileno(), ficlone, srcFile.fileno())
+        getModule('shutil', pgmLogger).copystat(srcFileNameExpanded, tgtFileNameExpanded)
+    except Exception as err:
+        errStr = str(err)
+        pgmLogger.warning('REFLINK of file: "%s" to "%s" FAILED: %s' % (srcFileNameExpanded, tgtFileNameExpanded, errStr))
+        # no fcntl module at all (e.g. on Windows)
+        # also means there is no reflink support
+        if srcDev is not None and \
+           (isinstance(err, ImportError) or getattr(err, 'errno', None) in unsupportedErrNos):
+            reflinkUnsupportedDevs.add(srcDev)
+        # remove any empty target
+        # the attempt left behind
+        if os.path.exists(tgtFileNameExpanded):
+            os.remove(tgtFileNameExpanded)
+
+    return errStr
+
+
+# ==============================================
+# Remove the spool sub-folders of staged files
+# left behind by runs that are no longer running
+# ==============================================
+def cleanSpoolPath(spoolPathName,
+                   pgmLogger=logging):
+    '''
+    Sub-folders staged by this process, or by any
+    process still running, are left alone.
+
+    :param spoolPathName:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+
+    spoolPathExpanded = getPathExpanded(spoolPathName)
+
+    if os.path.isdir(spoolPathExpanded):
+        shutil = getModule('shutil', pgmLogger)
+        for stgPathName in os.listdir(spoolPathExpanded):
+            stgPid = getStagingPid(stgPathName)
+            if stgPid is None or stgPid == os.getpid() or isProcessAlive(stgPid):
+                continue
+            stgPathExpanded = os.path.join(spoolPathExpanded, stgPathName)
+            try:
+                shutil.rmtree(stgPathExpanded)
+                pgmLogger.warning('Stale spool sub-folder "%s" removed' % stgPathExpanded)
+            except Exception as err:
+                errStr = str(err)
+                pgmLogger.error('Stale spool sub-folder "%s" removal FAILED' % stgPathExpanded)
+                pgmLogger.error(errStr)
+
+    return errStr
+
+
+# =================================================
+# Obtain the id of the process that staged into
+# a spool sub-folder, None if it is not one of ours
+# =================================================
+def getStagingPid(stgPathName):
+    '''
+
+    :param stgPathName: e.g. "stg1234_abcdefgh"
+    '''
+
+    stgPid = None
+
+    if stgPathName.startswith('stg') and '_' in stgPathName:
+        pidStr = stgPathName[len('stg'):stgPathName.index('_')]
+        if pidStr.isdigit():
+            stgPid = int(pidStr)
+
+    return stgPid
+
+
+# ======================================
+# Determine whether a process is running
+# ======================================
+def isProcessAlive(pid):
+    '''
+    Only determinable on POSIX systems, elsewhere
+    the process is assumed to still be running
+
+    :param pid:
+    '''
+
+    if os.name != 'posix':
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # e.g. it is another user's process
+        return True
+
+    return True
+
+
+# =============================================
+# Remove a staged file and its spool sub-folder
+# =============================================
+def unstageFile(stgFileName,
+                pgmLogger=logging):
+    '''
+
+    :param stgFileName:
+    :param pgmLogger:
+    '''
+
+    errStr = None
+
+    try:
+        if os.path.exists(stgFileName):
+            os.remove(stgFileName)
+        os.rmdir(os.path.dirname(stgFileName))
+        pgmLogger.info('UNSTAGE of file: "%s" SUCCEEDED' % stgFileName)
+    except Exception as err:
+        errStr = str(err)
+        pgmLogger.error('UNSTAGE of file: "%s" FAILED' % stgFileName)
+        pgmLogger.error(errStr)
+
+    return errStr
+
+
+# =============================================
+# Delete a source file, unless its producer has
+# replaced or modified it since it was staged
+# =============================================
+def deleteFileIfUnchanged(fileNameExpanded,
+                          fileStat,
+                          pgmLogger=logging):
+    '''
+
+    :param fileNameExpanded:
+    :param fileStat: the file's os.stat() from when it was staged
+    :param pgmLogger:
+    '''
+
+    errStr = None
+
+    try:
+        curStat = os.stat(fileNameExpanded)
+    except OSError:
+        curStat = None
+
+    if curStat is None:
+        pgmLogger.warning('File "%s" NOT deleted as it does NOT seem to exist' % fileNameExpanded)
+    elif (curStat.st_dev, curStat.st_ino, curStat.st_size, curStat.st_mtime) != \
+         (fileStat.st_dev, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime):
+        pgmLogger.warning('File "%s" NOT deleted as it has changed since it was staged' % fileNameExpanded)
+    else:
+        errStr = deleteFileIfItExists(fileNameExpanded,
+                                      pgmLogger=pgmLogger)
+
+    return errStr
+
+
 # ==========================================
 # Expand the specified folder path as needed
 # ==========================================
@@ -713,6 +1948,7 @@ def getPwdViaKeyring(key,
 
     # get the password for the specified key and login
     try:
+        keyring = getModule('keyring', pgmLogger)
         password = keyring.get_password(key, login)
         if password != None:
             if logResults:
@@ -0,0 +1,646 @@
+'''
+Tests of the PyFtpPusher Pusher class and its helpers
+'''
+
+import errno
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import PyFtpPusher
+
+
+# =======================================
+# Stand-in for a pysftp connection, whose
+# "remote" files are simply local files
+# =======================================
+class LocalSftpConn(object):
+    '''
+    Local SFTP Connection stand-in class
+    '''
+    def __init__(self, failOnWrite=False, failOnOpen=False, failOnRestore=False, onOpen=None):
+        self.failOnWrite = failOnWrite
+        self.failOnOpen = failOnOpen
+        self.failOnRestore = failOnRestore
+        self.onOpen = onOpen
+        self.bytesWritten = 0
+        self.maxWriteSize = 0
+        self.renameCount = 0
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def rename(self, src, dst):
+        if self.failOnRestore and src.endswith('.delta'):
+            raise IOError('rename failed')
+        os.rename(src, dst)
+        self.renameCount += 1
+
+    def put(self, localpath, remotepath):
+        shutil.copyfile(localpath, remotepath)
+        self.bytesWritten += os.path.getsize(localpath)
+
+    def open(self, path, mode):
+        if self.failOnOpen:
+            raise IOError('open failed')
+        if self.onOpen is not None:
+            self.onOpen()
+        return LocalSftpFile(self, path, 'wb' if mode == 'w' else 'r+b')
+
+
+class LocalSftpFile(object):
+    '''
+    Local SFTP File stand-in class
+    '''
+    def __init__(self, conn, path, mode):
+        self.conn = conn
+        self.file = open(path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.file.close()
+        return False
+
+    def set_pipelined(self, pipelined):
+        pass
+
+    def seek(self, offset):
+        self.file.seek(offset)
+
+    def write(self, data):
+        self.file.write(data)
+        self.conn.bytesWritten += len(data)
+        self.conn.maxWriteSize = max(self.conn.maxWriteSize, len(data))
+        if self.conn.failOnWrite:
+            raise IOError('write failed')
+
+    def truncate(self, size):
+        self.file.truncate(size)
+
+
+# =========================================
+# Stand-in for an ftputil connection, which
+# records the files it is asked to upload
+# =========================================
+class FakeFtpHost(object):
+    '''
+    Fake FTP Host class
+    '''
+    def __init__(self):
+        self.uploads = []
+        self.isDropped = False
+        self.isClosed = False
+        self.probeCount = 0
+        self.onUpload = None
+        self.path = FakeFtpHostPath(self)
+
+    def upload(self, source, target, callback):
+        if self.isDropped:
+            raise EOFError('Server connection dropped')
+        if self.onUpload is not None:
+            self.onUpload(source)
+        self.uploads.append(target)
+
+    def keep_alive(self):
+        self.probeCount += 1
+        if self.isDropped:
+            raise EOFError('Server connection dropped')
+
+    def close(self):
+        self.isClosed = True
+
+
+class FakeFtpHostPath(object):
+    '''
+    Fake FTP Host Path class
+    '''
+    def __init__(self, ftpHost):
+        self.ftpHost = ftpHost
+
+    def exists(self, path):
+        if self.ftpHost.isDropped:
+            raise EOFError('Server connection dropped')
+        return True
+
+    def join(self, *paths):
+        return posixpath.join(*paths)
+
+
+class PusherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpPathName = tempfile.mkdtemp()
+        self.srcFileNames = []
+        for srcBaseName in ('a.txt', 'b.txt', 'c.txt'):
+            srcFileName = os.path.join(self.tmpPathName, srcBaseName)
+            with open(srcFileName, 'w') as srcFile:
+                srcFile.write(srcBaseName)
+            self.srcFileNames.append(srcFileName)
+        self.ftpHosts = []
+        patcher = mock.patch.object(PyFtpPusher, 'getFtpConn', side_effect=self.getFtpConn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPathName)
+
+    def getFtpConn(self, **kwargs):
+        self.ftpHosts.append(FakeFtpHost())
+        return self.ftpHosts[-1], None
+
+
+class TestPusher(PusherTestCase):
+
+    def test_results_are_streamed_per_file(self):
+        pushed = []
+
+        def srcFileNames():
+            for srcFileName in self.srcFileNames:
+                pushed.append(srcFileName)
+                yield srcFileName
+
+        with PyFtpPusher.Pusher('ftp.example.com', ftpPath='/up') as pusher:
+            pushResults = pusher.pushBatch(srcFileNames())
+            pushResult = next(pushResults)
+            self.assertEqual(pushed, self.srcFileNames[:1])
+            self.assertTrue(pushResult.successful)
+            self.assertEqual(pushResult.srcFileName, self.srcFileNames[0])
+            self.assertEqual([pushResult.successful for pushResult in pushResults], [True, True])
+        self.assertEqual(len(self.ftpHosts), 1)
+        self.assertEqual(self.ftpHosts[0].uploads, ['/up/a.txt', '/up/b.txt', '/up/c.txt'])
+        self.assertTrue(self.ftpHosts[0].isClosed)
+
+    def test_missing_file_fails_only_that_file(self):
+        srcFileNames = [self.srcFileNames[0], os.path.join(self.tmpPathName, 'missing.txt')]
+        with PyFtpPusher.Pusher('ftp.example.com') as pusher:
+            pushResults = list(pusher.pushBatch(srcFileNames))
+        self.assertEqual([pushResult.successful for pushResult in pushResults], [True, False])
+
+    def test_dropped_connection_fails_one_file_then_reconnects(self):
+        with PyFtpPusher.Pusher('ftp.example.com', ftpPath='/up') as pusher:
+            pushResults = pusher.pushBatch(self.srcFileNames)
+            self.assertTrue(next(pushResults).successful)
+            self.ftpHosts[0].isDropped = True
+            pushResult = next(pushResults)
+            self.assertFalse(pushResult.successful)
+            self.assertIn('Server connection dropped', pushResult.errStr)
+            self.assertIsNone(pusher.ftpConn)
+            self.assertTrue(next(pushResults).successful)
+        self.assertEqual(len(self.ftpHosts), 2)
+        self.assertTrue(self.ftpHosts[0].isClosed)
+        self.assertEqual(self.ftpHosts[1].uploads, ['/up/c.txt'])
+
+    def test_idle_connection_is_probed_and_replaced(self):
+        with PyFtpPusher.Pusher('ftp.example.com', probeIdleSeconds=0) as pusher:
+            self.assertIsNone(pusher.connect())
+            self.ftpHosts[0].isDropped = True
+            self.assertIsNone(pusher.connect())
+            self.assertEqual(self.ftpHosts[0].probeCount, 1)
+            self.assertTrue(self.ftpHosts[0].isClosed)
+            self.assertIs(pusher.ftpConn, self.ftpHosts[1])
+
+    def test_recently_used_connection_is_not_probed(self):
+        with PyFtpPusher.Pusher('ftp.example.com', probeIdleSeconds=60) as pusher:
+            self.assertIsNone(pusher.connect())
+            self.assertIsNone(pusher.connect())
+            self.assertEqual(self.ftpHosts[0].probeCount, 0)
+            self.assertEqual(len(self.ftpHosts), 1)
+
+    def test_probe_reports_dropped_connection(self):
+        with PyFtpPusher.Pusher('ftp.example.com') as pusher:
+            self.assertIsNone(pusher.connect())
+            self.assertIsNone(pusher.probe())
+            self.ftpHosts[0].isDropped = True
+            self.assertEqual(pusher.probe(), 'Server connection dropped')
+
+
+class TestPusherWithSpool(PusherTestCase):
+
+    def setUp(self):
+        PusherTestCase.setUp(self)
+        self.spoolPathName = os.path.join(self.tmpPathName, 'spool')
+        os.makedirs(self.spoolPathName)
+
+    def getFtpConn(self, **kwargs):
+        ftpHost, errStr = PusherTestCase.getFtpConn(self, **kwargs)
+        ftpHost.onUpload = self.onUpload
+        return ftpHost, errStr
+
+    def onUpload(self, source):
+        self.assertTrue(source.startswith(self.spoolPathName))
+        self.stagedCounts.append(len(os.listdir(self.spoolPathName)))
+
+    def pusher(self, **kwargs):
+        self.stagedCounts = []
+        return PyFtpPusher.Pusher('ftp.example.com', spoolPathName=self.spoolPathName, **kwargs)
+
+    def test_whole_batch_is_staged_before_uploads(self):
+        with self.pusher() as pusher:
+            pushResults = list(pusher.pushBatch(self.srcFileNames))
+        self.assertTrue(all(pushResult.successful for pushResult in pushResults))
+        self.assertEqual(self.stagedCounts, [3, 2, 1])
+        self.assertEqual(os.listdir(self.spoolPathName), [])
+
+    def test_batch_is_staged_in_chunks(self):
+        with self.pusher(stageChunkSize=2) as pusher:
+            list(pusher.pushBatch(self.srcFileNames))
+        self.assertEqual(self.stagedCounts, [2, 1, 1])
+
+    def test_failed_uploads_are_unstaged(self):
+        with self.pusher() as pusher:
+            self.assertIsNone(pusher.connect())
+            self.ftpHosts[0].isDropped = True
+            pushResults = pusher.pushBatch(self.srcFileNames)
+            self.assertFalse(next(pushResults).successful)
+            self.assertEqual(len(os.listdir(self.spoolPathName)), 2)
+            pushResults.close()
+        self.assertEqual(os.listdir(self.spoolPathName), [])
+
+    @unittest.skipUnless(os.name == 'posix', 'requires POSIX process ids')
+    def test_stale_spool_sub_folders_are_removed(self):
+        deadProcess = subprocess.Popen([sys.executable, '-c', 'pass'])
+        deadProcess.wait()
+        for stgPid in (deadProcess.pid, os.getpid()):
+            stgPathName = os.path.join(self.spoolPathName, 'stg%d_test' % stgPid)
+            os.makedirs(stgPathName)
+            with open(os.path.join(stgPathName, 'a.txt'), 'w') as stgFile:
+                stgFile.write('a')
+        os.makedirs(os.path.join(self.spoolPathName, 'other'))
+        self.pusher()
+        self.assertEqual(sorted(os.listdir(self.spoolPathName)),
+                         ['other', 'stg%d_test' % os.getpid()])
+
+
+# ============================================
+# Stand-in for the fcntl module, whose FICLONE
+# either fails or copies the file's contents
+# ============================================
+class FakeFcntl(object):
+    '''
+    Fake fcntl module class
+    '''
+    def __init__(self, errNo=None):
+        self.errNo = errNo
+        self.callCount = 0
+
+    def ioctl(self, tgtFd, request, srcFd):
+        self.callCount += 1
+        if self.errNo is not None:
+            raise OSError(self.errNo, os.strerror(self.errNo))
+        data = os.read(srcFd, 1024 * 1024)
+        while data:
+            os.write(tgtFd, data)
+            data = os.read(srcFd, 1024 * 1024)
+
+
+class TestStageFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpPathName = tempfile.mkdtemp()
+        self.srcFileName = os.path.join(self.tmpPathName, 'a.txt')
+        with open(self.srcFileName, 'w') as srcFile:
+            srcFile.write('snapshot me')
+        self.spoolPathName = os.path.join(self.tmpPathName, 'spool')
+        patcher = mock.patch.object(PyFtpPusher, 'reflinkUnsupportedDevs', set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPathName)
+
+    def stageFile(self, fcntl):
+        with mock.patch.dict(PyFtpPusher.importedModules, {'fcntl': fcntl}):
+            return PyFtpPusher.stageFile(self.srcFileName, self.spoolPathName)
+
+    def test_reflink_is_preferred(self):
+        fcntl = FakeFcntl()
+        stgFileName, srcStat, errStr = self.stageFile(fcntl)
+        self.assertIsNone(errStr)
+        self.assertFalse(os.path.samefile(stgFileName, self.srcFileName))
+        with open(stgFileName) as stgFile:
+            self.assertEqual(stgFile.read(), 'snapshot me')
+        self.assertEqual(srcStat.st_ino, os.stat(self.srcFileName).st_ino)
+
+    def test_hard_link_fallback_records_unsupported_device(self):
+        fcntl = FakeFcntl(errno.EOPNOTSUPP)
+        stgFileName, srcStat, errStr = self.stageFile(fcntl)
+        self.assertIsNone(errStr)
+        self.assertTrue(os.path.samefile(stgFileName, self.srcFileName))
+        self.assertEqual(PyFtpPusher.reflinkUnsupportedDevs, {srcStat.st_dev})
+        # the reflink is not tried again on that file system
+        stgFileName, srcStat, errStr = self.stageFile(fcntl)
+        self.assertIsNone(errStr)
+        self.assertEqual(fcntl.callCount, 1)
+
+    def test_transient_reflink_error_is_not_recorded(self):
+        for errNo in (errno.EPERM, errno.ENOSPC):
+            fcntl = FakeFcntl(errNo)
+            stgFileName, srcStat, errStr = self.stageFile(fcntl)
+            self.assertIsNone(errStr)
+            self.assertTrue(os.path.samefile(stgFileName, self.srcFileName))
+            self.assertEqual(PyFtpPusher.reflinkUnsupportedDevs, set())
+
+    def test_cross_device_spool_is_rejected(self):
+        os.makedirs(self.spoolPathName)
+        realStat = os.stat
+
+        def stat(path, *args, **kwargs):
+            pathStat = realStat(path, *args, **kwargs)
+            if os.path.abspath(path) == self.spoolPathName:
+                pathStat = os.stat_result((pathStat.st_mode, pathStat.st_ino, pathStat.st_dev + 1,
+                                           pathStat.st_nlink, pathStat.st_uid, pathStat.st_gid,
+                                           pathStat.st_size, pathStat.st_atime, pathStat.st_mtime,
+                                           pathStat.st_ctime))
+            return pathStat
+
+        with mock.patch('os.stat', side_effect=stat):
+            stgFileName, srcStat, errStr = self.stageFile(FakeFcntl())
+        self.assertIsNone(stgFileName)
+        self.assertIn('NOT on the same file system', errStr)
+        self.assertEqual(os.listdir(self.spoolPathName), [])
+
+    def test_unstage_removes_spool_sub_folder(self):
+        stgFileName, srcStat, errStr = self.stageFile(FakeFcntl(errno.EOPNOTSUPP))
+        self.assertEqual(len(os.listdir(self.spoolPathName)), 1)
+        self.assertIsNone(PyFtpPusher.unstageFile(stgFileName))
+        self.assertEqual(os.listdir(self.spoolPathName), [])
+        self.assertTrue(os.path.exists(self.srcFileName))
+
+
+class TestDeleteFileIfUnchanged(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpPathName = tempfile.mkdtemp()
+        self.srcFileName = os.path.join(self.tmpPathName, 'a.txt')
+        with open(self.srcFileName, 'w') as srcFile:
+            srcFile.write('original')
+        self.srcStat = os.stat(self.srcFileName)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPathName)
+
+    def deleteFileIfUnchanged(self):
+        return PyFtpPusher.deleteFileIfUnchanged(self.srcFileName, self.srcStat)
+
+    def test_unchanged_file_is_deleted(self):
+        self.assertIsNone(self.deleteFileIfUnchanged())
+        self.assertFalse(os.path.exists(self.srcFileName))
+
+    def test_resized_file_is_kept(self):
+        with open(self.srcFileName, 'a') as srcFile:
+            srcFile.write(' and more')
+        os.utime(self.srcFileName, (self.srcStat.st_atime, self.srcStat.st_mtime))
+        self.assertIsNone(self.deleteFileIfUnchanged())
+        self.assertTrue(os.path.exists(self.srcFileName))
+
+    def test_modified_file_is_kept(self):
+        os.utime(self.srcFileName, (self.srcStat.st_atime, self.srcStat.st_mtime + 10))
+        self.assertIsNone(self.deleteFileIfUnchanged())
+        self.assertTrue(os.path.exists(self.srcFileName))
+
+    def test_replaced_file_is_kept(self):
+        # keep the original inode alive, as a staged hard link
+        # would, so that the replacement cannot reuse it
+        os.link(self.srcFileName, self.srcFileName + '.staged')
+        newFileName = os.path.join(self.tmpPathName, 'a.new')
+        with open(newFileName, 'w') as newFile:
+            newFile.write('replaced')
+        os.utime(newFileName, (self.srcStat.st_atime, self.srcStat.st_mtime))
+        os.replace(newFileName, self.srcFileName)
+        self.assertIsNone(self.deleteFileIfUnchanged())
+        self.assertTrue(os.path.exists(self.srcFileName))
+
+
+class TestGetChangedRanges(unittest.TestCase):
+
+    def test_unchanged(self):
+        self.assertEqual(PyFtpPusher.getChangedRanges(['a', 'b'], ['a', 'b'], 10), [])
+
+    def test_adjacent_blocks_are_merged(self):
+        self.assertEqual(PyFtpPusher.getChangedRanges([], ['a', 'b', 'c'], 10), [(0, 30)])
+
+    def test_separate_blocks_are_not_merged(self):
+        self.assertEqual(PyFtpPusher.getChangedRanges(['a', 'b', 'c', 'd'], ['x', 'b', 'y', 'z'], 10),
+                         [(0, 10), (20, 20)])
+
+    def test_file_grows(self):
+        self.assertEqual(PyFtpPusher.getChangedRanges(['a', 'b'], ['a', 'b', 'c'], 10), [(20, 10)])
+
+    def test_file_shrinks(self):
+        self.assertEqual(PyFtpPusher.getChangedRanges(['a', 'b', 'c'], ['a', 'x'], 10), [(10, 10)])
+        self.assertEqual(PyFtpPusher.getChangedRanges(['a', 'b', 'c'], ['a'], 10), [])
+
+
+class TestGetFileBlockHashes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpPathName = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.tmpPathName, 'blocks.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPathName)
+
+    def writeFile(self, data):
+        with open(self.fileName, 'wb') as dataFile:
+            dataFile.write(data)
+
+    def test_short_last_block(self):
+        self.writeFile(b'0123456789abc')
+        blockHashes, errStr = PyFtpPusher.getFileBlockHashes(self.fileName, 10)
+        self.assertIsNone(errStr)
+        self.assertEqual(blockHashes, [hashlib.sha1(b'0123456789').hexdigest(),
+                                       hashlib.sha1(b'abc').hexdigest()])
+
+    def test_exact_multiple_of_block_size(self):
+        self.writeFile(b'x' * 20)
+        blockHashes, errStr = PyFtpPusher.getFileBlockHashes(self.fileName, 10)
+        self.assertIsNone(errStr)
+        self.assertEqual(len(blockHashes), 2)
+
+    def test_empty_file(self):
+        self.writeFile(b'')
+        self.assertEqual(PyFtpPusher.getFileBlockHashes(self.fileName, 10), ([], None))
+
+    def test_missing_file(self):
+        blockHashes, errStr = PyFtpPusher.getFileBlockHashes(self.fileName + '.missing', 10)
+        self.assertEqual(blockHashes, [])
+        self.assertIsNotNone(errStr)
+
+
+class TestLoadSignature(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpPathName = tempfile.mkdtemp()
+        self.sigFileName = os.path.join(self.tmpPathName, 'sig.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPathName)
+
+    def writeSignature(self, signature):
+        with open(self.sigFileName, 'w') as sigFile:
+            json.dump(signature, sigFile)
+
+    def test_valid(self):
+        signature = {'blockSize': 10, 'fileSize': 13, 'blockHashes': ['a', 'b'],
+                     'remoteSize': 13, 'remoteMtime': 1.5}
+        self.writeSignature(signature)
+        self.assertEqual(PyFtpPusher.loadSignature(self.sigFileName), signature)
+
+    def test_valid_interrupted_patch(self):
+        signature = {'blockSize': 10, 'fileSize': 13, 'blockHashes': ['a', None],
+                     'remoteSize': None, 'remoteMtime': None, 'ftpTempFullPath': '/up/a.delta'}
+        self.writeSignature(signature)
+        self.assertEqual(PyFtpPusher.loadSignature(self.sigFileName), signature)
+
+    def test_malformed(self):
+        for signature in ([1, 2],
+                          {'blockSize': 10},
+                          {'blockSize': 10, 'fileSize': 13, 'blockHashes': 'ab',
+                           'remoteSize': 13, 'remoteMtime': 1.5},
+                          {'blockSize': 10, 'fileSize': 13, 'blockHashes': ['a', None],
+                           'remoteSize': None, 'remoteMtime': None}):
+            self.writeSignature(signature)
+            self.assertIsNone(PyFtpPusher.loadSignature(self.sigFileName))
+
+    def test_missing(self):
+        self.assertIsNone(PyFtpPusher.loadSignature(self.sigFileName))
+
+
+class TestPutFtpFileDeltaViaPysftp(unittest.TestCase):
+
+    blockSize = 10
+
+    def setUp(self):
+        self.tmpPathName = tempfile.mkdtemp()
+        self.srcFileName = os.path.join(self.tmpPathName, 'src.bin')
+        self.ftpFileName = os.path.join(self.tmpPathName, 'ftp.bin')
+        self.sigFileName = os.path.join(self.tmpPathName, 'sig', 'ftp.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpPathName)
+
+    def push(self, data, ftpConn):
+        with open(self.srcFileName, 'wb') as srcFile:
+            srcFile.write(data)
+        return PyFtpPusher.putFtpFileDeltaViaPysftp(ftpConn,
+                                                    self.srcFileName,
+                                                    self.ftpFileName,
+                                                    self.sigFileName,
+                                                    blockSize=self.blockSize)
+
+    def readFtpFile(self):
+        with open(self.ftpFileName, 'rb') as ftpFile:
+            return ftpFile.read()
+
+    def test_only_changed_blocks_are_sent(self):
+        data = bytes(range(95))
+        self.assertIsNone(self.push(data, LocalSftpConn()))
+        ftpConn = LocalSftpConn()
+        data = data[:42] + b'!' + data[43:]
+        self.assertIsNone(self.push(data, ftpConn))
+        self.assertEqual(ftpConn.bytesWritten, self.blockSize)
+        self.assertEqual(self.readFtpFile(), data)
+
+    def test_grow_and_shrink(self):
+        data = bytes(range(95))
+        self.assertIsNone(self.push(data, LocalSftpConn()))
+        for data in (data + b'tail' * 10, data[:33]):
+            self.assertIsNone(self.push(data, LocalSftpConn()))
+            self.assertEqual(self.readFtpFile(), data)
+
+    def test_large_range_is_written_block_by_block(self):
+        self.assertIsNone(self.push(b'a' * 100, LocalSftpConn()))
+        ftpConn = LocalSftpConn()
+        self.assertIsNone(self.push(b'b' * 100, ftpConn))
+        self.assertEqual(ftpConn.bytesWritten, 100)
+        self.assertEqual(ftpConn.maxWriteSize, self.blockSize)
+
+    def test_failed_open_restores_remote_file(self):
+        self.assertIsNone(self.push(b'a' * 30, LocalSftpConn()))
+        self.assertIsNotNone(self.push(b'b' * 30, LocalSftpConn(failOnOpen=True)))
+        self.assertEqual(self.readFtpFile(), b'a' * 30)
+        self.assertFalse(os.path.exists(self.ftpFileName + '.delta'))
+        # the restored file still matches its signature
+        ftpConn = LocalSftpConn()
+        self.assertIsNone(self.push(b'a' * 30, ftpConn))
+        self.assertEqual(ftpConn.bytesWritten, 0)
+
+    def test_failed_write_is_resumed(self):
+        data = bytes(range(95))
+        self.assertIsNone(self.push(data, LocalSftpConn()))
+        data = data[:15] + b'!' + data[16:55] + b'!' + data[56:]
+        self.assertIsNotNone(self.push(data, LocalSftpConn(failOnWrite=True)))
+        self.assertFalse(os.path.exists(self.ftpFileName))
+        self.assertTrue(os.path.exists(self.ftpFileName + '.delta'))
+        ftpConn = LocalSftpConn()
+        self.assertIsNone(self.push(data, ftpConn))
+        self.assertEqual(self.readFtpFile(), data)
+        self.assertFalse(os.path.exists(self.ftpFileName + '.delta'))
+        self.assertEqual(ftpConn.bytesWritten, 2 * self.blockSize)
+
+    def test_failed_shrink_is_resumed(self):
+        data = bytes(range(95))
+        self.assertIsNone(self.push(data, LocalSftpConn()))
+        # the patch is written, and truncated,
+        # but its ".delta" file is not renamed back
+        self.assertIsNotNone(self.push(data[:10] + b'!' + data[11:33], LocalSftpConn(failOnRestore=True)))
+        self.assertEqual(os.path.getsize(self.ftpFileName + '.delta'), 33)
+        # the truncated blocks must be re-sent
+        self.assertIsNone(self.push(data, LocalSftpConn()))
+        self.assertEqual(self.readFtpFile(), data)
+
+    def test_unchanged_file_is_left_alone(self):
+        self.assertIsNone(self.push(b'a' * 30, LocalSftpConn()))
+        ftpMtime = os.stat(self.ftpFileName).st_mtime
+        ftpConn = LocalSftpConn()
+        self.assertIsNone(self.push(b'a' * 30, ftpConn))
+        self.assertEqual(ftpConn.bytesWritten, 0)
+        self.assertEqual(ftpConn.renameCount, 0)
+        self.assertEqual(os.stat(self.ftpFileName).st_mtime, ftpMtime)
+
+    def rewriteSrcFile(self, data):
+        def onOpen():
+            with open(self.srcFileName, 'wb') as srcFile:
+                srcFile.write(data)
+        return onOpen
+
+    def test_signature_describes_the_bytes_uploaded(self):
+        # the file is rewritten once its upload has begun
+        self.assertIsNone(self.push(b'a' * 30, LocalSftpConn(onOpen=self.rewriteSrcFile(b'b' * 30))))
+        self.assertEqual(self.readFtpFile(), b'b' * 30)
+        self.assertIsNone(self.push(b'a' * 30, LocalSftpConn()))
+        self.assertEqual(self.readFtpFile(), b'a' * 30)
+
+    def test_signature_describes_the_blocks_patched(self):
+        self.assertIsNone(self.push(b'a' * 30, LocalSftpConn()))
+        # the file is rewritten once its patch has begun
+        ftpConn = LocalSftpConn(onOpen=self.rewriteSrcFile(b'c' * 30))
+        self.assertIsNone(self.push(b'a' * 10 + b'b' * 20, ftpConn))
+        self.assertEqual(self.readFtpFile(), b'a' * 10 + b'c' * 20)
+        self.assertIsNone(self.push(b'c' * 30, LocalSftpConn()))
+        self.assertEqual(self.readFtpFile(), b'c' * 30)
+
+    def test_file_resized_during_patch_fails_then_resumes(self):
+        self.assertIsNone(self.push(b'a' * 30, LocalSftpConn()))
+        ftpConn = LocalSftpConn(onOpen=self.rewriteSrcFile(b'b' * 25))
+        self.assertIn('changed while it was being pushed', self.push(b'b' * 30, ftpConn))
+        self.assertIsNone(self.push(b'b' * 25, LocalSftpConn()))
+        self.assertEqual(self.readFtpFile(), b'b' * 25)
+
+if __name__ == '__main__':
+    unittest.main()